@@ -1,67 +1,202 @@
 # api.py
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, Field
 from typing import List, Optional
 import uvicorn
 from datetime import datetime
 import json
+import orjson
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 import os
+import io
+import re
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Create a directory for PDFs if it doesn't exist
-if not os.path.exists('appointment_pdfs'):
-    os.makedirs('appointment_pdfs')
+os.makedirs('appointment_pdfs', exist_ok=True)
 
-# In-memory storage (replace with database in production)
-appointments = []
+# SQLite storage shared by all worker processes
+DB_PATH = os.environ.get("APPOINTMENTS_DB", "appointments.db")
+_APPOINTMENT_COLUMNS = "id, patient_name, contact_number, appointment_date, status"
+_REFERENCE_ID = re.compile(r'APT-(\d{4,})')
+_local = threading.local()
+
+def get_db() -> sqlite3.Connection:
+    """Return this thread's SQLite connection, opening it on first use"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA busy_timeout=5000")
+        # WAL lets readers proceed while another worker is writing
+        conn.execute("PRAGMA journal_mode=WAL")
+        _local.conn = conn
+    return conn
+
+def init_db():
+    """Create the appointments table if it doesn't exist"""
+    get_db().execute("""
+        CREATE TABLE IF NOT EXISTS appointments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_name TEXT NOT NULL,
+            contact_number TEXT NOT NULL,
+            appointment_date TEXT,
+            status TEXT
+        )
+    """)
+
+# reference_id is derived from the autoincrement id rather than stored, so
+# concurrent inserts from different workers can never produce the same
+# APT-XXXX (and no generated columns or RETURNING, which older SQLite lacks)
+def _reference_id(row_id: int) -> str:
+    """Format a row id as an APT-XXXX reference ID"""
+    return f"APT-{row_id:04d}"
+
+def _row_to_appointment(row: sqlite3.Row) -> dict:
+    """Convert a database row to the appointment dict served by the API"""
+    return {
+        "patient_name": row["patient_name"],
+        "contact_number": row["contact_number"],
+        "appointment_date": row["appointment_date"],
+        "reference_id": _reference_id(row["id"]),
+        "status": row["status"]
+    }
+
+def insert_appointment(appointment_data: dict) -> str:
+    """Store an appointment and return its generated reference ID"""
+    cursor = get_db().execute(
+        "INSERT INTO appointments (patient_name, contact_number, appointment_date, status) "
+        "VALUES (?, ?, ?, ?)",
+        (
+            appointment_data["patient_name"],
+            appointment_data["contact_number"],
+            appointment_data["appointment_date"],
+            appointment_data["status"]
+        )
+    )
+    return _reference_id(cursor.lastrowid)
+
+def fetch_appointment(reference_id: str) -> Optional[dict]:
+    """Look up a single appointment by reference ID"""
+    match = _REFERENCE_ID.fullmatch(reference_id)
+    # Reject non-canonical forms such as APT-00001
+    if match is None or _reference_id(int(match.group(1))) != reference_id:
+        return None
+    row = get_db().execute(
+        f"SELECT {_APPOINTMENT_COLUMNS} FROM appointments WHERE id = ?",
+        (int(match.group(1)),)
+    ).fetchone()
+    return _row_to_appointment(row) if row is not None else None
+
+def fetch_all_appointments() -> List[dict]:
+    """Return every appointment in booking order"""
+    rows = get_db().execute(
+        f"SELECT {_APPOINTMENT_COLUMNS} FROM appointments ORDER BY id"
+    ).fetchall()
+    return [_row_to_appointment(row) for row in rows]
+
+init_db()
+
+# Appointments never change after booking, so their encoded GET bodies can
+# be cached per process. SQLite stays the source of truth; the cache is an
+# LRU capped at APPOINTMENT_CACHE_SIZE entries so workers don't each end up
+# holding a copy of the whole table.
+APPOINTMENT_CACHE_SIZE = int(os.environ.get("APPOINTMENT_CACHE_SIZE", 1024))
+_appointment_bytes: "OrderedDict[str, bytes]" = OrderedDict()
+
+def _cache_appointment_bytes(reference_id: str, body: bytes):
+    """Store an encoded appointment, evicting the least recently used one"""
+    _appointment_bytes[reference_id] = body
+    _appointment_bytes.move_to_end(reference_id)
+    if len(_appointment_bytes) > APPOINTMENT_CACHE_SIZE:
+        _appointment_bytes.popitem(last=False)
 
 class Appointment(BaseModel):
-    patient_name: str
-    contact_number: str
+    # Patterns mirror the client-side validators in app.py
+    patient_name: str = Field(pattern=r'^(?:[^\W\d_]|\s)+$')
+    contact_number: str = Field(pattern=r'^\+91\s\d{10}$')
     appointment_date: Optional[str] = None
     reference_id: Optional[str] = None
     status: Optional[str] = "scheduled"
 
+# Client-facing messages for fields that fail model validation
+_VALIDATION_MESSAGES = {
+    "patient_name": "Invalid patient name. Please use only letters and spaces.",
+    "contact_number": "Invalid phone number format. Must be +91 followed by 10 digits"
+}
+
+@app.exception_handler(RequestValidationError)
+async def validation_exception_handler(request: Request, exc: RequestValidationError):
+    # Return a 400 with a plain string detail (as before the model patterns)
+    # rather than FastAPI's 422 list, which also echoes the rejected input
+    messages = []
+    for error in exc.errors():
+        field = error["loc"][-1] if error["loc"] else "body"
+        message = _VALIDATION_MESSAGES.get(field, f"Invalid {field}: {error['msg']}")
+        if message not in messages:
+            messages.append(message)
+    return ORJSONResponse(status_code=400, content={"detail": " ".join(messages)})
+
+# Shape of the POST /appointments/ body; handlers return ORJSONResponse
+# directly to skip response validation.
 class AppointmentResponse(BaseModel):
     reference_id: str
     status: str
     message: str
     pdf_path: Optional[str]
 
-def generate_appointment_pdf(appointment_data: dict) -> str:
-    """Generate PDF for appointment confirmation"""
-    pdf_filename = f"appointment_pdfs/appointment_{appointment_data['reference_id']}.pdf"
-    
+# PDF styles are identical for every appointment, so build them once
+_STYLES = getSampleStyleSheet()
+_TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=_STYLES['Heading1'],
+    fontSize=24,
+    spaceAfter=30,
+    alignment=1  # Center alignment
+)
+_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+    ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 12),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+    ('BACKGROUND', (0, -1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+])
+
+def render_appointment_pdf(appointment_data: dict, page_compression: Optional[int] = None,
+                           invariant: Optional[int] = None) -> bytes:
+    """Lay out the appointment confirmation PDF and return its bytes"""
+    buffer = io.BytesIO()
     doc = SimpleDocTemplate(
-        pdf_filename,
+        buffer,
         pagesize=letter,
         rightMargin=72,
         leftMargin=72,
         topMargin=72,
-        bottomMargin=72
+        bottomMargin=72,
+        pageCompression=page_compression,
+        invariant=invariant
     )
 
     # Container for elements
     elements = []
     
-    # Styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        spaceAfter=30,
-        alignment=1  # Center alignment
-    )
-    
     # Add content
-    elements.append(Paragraph("Appointment Confirmation", title_style))
+    elements.append(Paragraph("Appointment Confirmation", _TITLE_STYLE))
     elements.append(Spacer(1, 12))
     
     # Create table data
@@ -75,66 +210,151 @@ def generate_appointment_pdf(appointment_data: dict) -> str:
     
     # Create table
     table = Table(data, colWidths=[2*inch, 4*inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-        ('BACKGROUND', (0, -1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
+    table.setStyle(_TABLE_STYLE)
     
     elements.append(table)
     elements.append(Spacer(1, 20))
     
     # Add footer
     footer_text = "Thank you for choosing our healthcare services. Please arrive 15 minutes before your scheduled appointment."
-    elements.append(Paragraph(footer_text, styles["Normal"]))
+    elements.append(Paragraph(footer_text, _STYLES["Normal"]))
     
     # Build PDF
     doc.build(elements)
+    return buffer.getvalue()
+
+# Only the table values and document metadata differ between confirmations,
+# so render the PDF once (uncompressed, invariant metadata) with fixed-width
+# placeholders and patch the values into the bytes per appointment. Lengths
+# must match exactly to keep the xref offsets valid, so values are
+# space-padded to the placeholder width, the creation/modification dates are
+# rewritten in the same fixed-width PDF date format, and the trailer /ID is
+# replaced by an MD5 of the patched document.
+_PDF_FIELD_WIDTHS = {
+    "reference_id": 16,
+    "patient_name": 64,
+    "contact_number": 16,
+    "appointment_date": 24,
+    "status": 16
+}
+# Characters that appear verbatim inside a PDF string literal
+_PDF_SAFE_TEXT = re.compile(r'[A-Za-z0-9 +:\-]*')
+_PDF_DATE = re.compile(rb"/CreationDate \((D:[0-9+\-Z']+)\)")
+_PDF_ID = re.compile(rb"/ID\s*\[<([0-9A-Fa-f]{32})><\1>\]")
+
+def _build_pdf_template():
+    """Render the placeholder PDF and return it with the bytes to patch"""
+    placeholders = {
+        field: f"{{{field}}}".ljust(width, "#").encode()
+        for field, width in _PDF_FIELD_WIDTHS.items()
+    }
+    template = render_appointment_pdf(
+        {field: placeholder.decode() for field, placeholder in placeholders.items()},
+        page_compression=0,
+        invariant=1
+    )
+    date_match = _PDF_DATE.search(template)
+    id_match = _PDF_ID.search(template)
+    # Fall back to full rendering if reportlab didn't emit each placeholder,
+    # the creation/modification date pair and the /ID pair verbatim
+    if (any(template.count(placeholder) != 1 for placeholder in placeholders.values())
+            or date_match is None or template.count(date_match.group(1)) != 2
+            or id_match is None or template.count(id_match.group(1)) != 2):
+        return None, {}, b"", b""
+    return template, placeholders, date_match.group(1), id_match.group(1)
+
+_PDF_TEMPLATE, _PDF_PLACEHOLDERS, _PDF_TEMPLATE_DATE, _PDF_TEMPLATE_ID = _build_pdf_template()
+
+def _pdf_date(appointment_date: str) -> bytes:
+    """Format a booking timestamp as a PDF date string in local time"""
+    booked = datetime.strptime(appointment_date, "%Y-%m-%d %H:%M:%S").astimezone()
+    offset = int(booked.utcoffset().total_seconds()) // 60
+    hours, minutes = divmod(abs(offset), 60)
+    sign = "+" if offset >= 0 else "-"
+    return f"D:{booked:%Y%m%d%H%M%S}{sign}{hours:02d}'{minutes:02d}'".encode()
+
+def _fill_pdf_template(appointment_data: dict) -> Optional[bytes]:
+    """Patch appointment values into the PDF template, or None if they don't fit"""
+    if _PDF_TEMPLATE is None:
+        return None
+    pdf = _PDF_TEMPLATE
+    for field, placeholder in _PDF_PLACEHOLDERS.items():
+        value = appointment_data[field]
+        if (not isinstance(value, str) or len(value) > len(placeholder)
+                or _PDF_SAFE_TEXT.fullmatch(value) is None):
+            return None
+        pdf = pdf.replace(placeholder, value.encode().ljust(len(placeholder)))
+    try:
+        created = _pdf_date(appointment_data["appointment_date"])
+    except ValueError:
+        return None
+    if len(created) != len(_PDF_TEMPLATE_DATE):
+        return None
+    pdf = pdf.replace(_PDF_TEMPLATE_DATE, created)
+    return pdf.replace(_PDF_TEMPLATE_ID, hashlib.md5(pdf).hexdigest().encode())
+
+def generate_appointment_pdf(appointment_data: dict) -> str:
+    """Generate PDF for appointment confirmation"""
+    pdf_filename = f"appointment_pdfs/appointment_{appointment_data['reference_id']}.pdf"
+    
+    pdf = _fill_pdf_template(appointment_data)
+    if pdf is None:
+        pdf = render_appointment_pdf(appointment_data)
+    with open(pdf_filename, "wb") as f:
+        f.write(pdf)
     
     return pdf_filename
 
-@app.post("/appointments/", response_model=AppointmentResponse)
+@app.post("/appointments/")
 async def create_appointment(appointment: Appointment):
-    # Validate phone number
-    if not appointment.contact_number.startswith('+91'):
-        raise HTTPException(status_code=400, detail="Invalid phone number format. Must start with +91")
-    
-    # Generate reference ID
-    reference_id = f"APT-{len(appointments)+1:04d}"
-    
-    # Add reference ID and date to appointment
+    # Add date to appointment
     appointment_dict = appointment.dict()
-    appointment_dict["reference_id"] = reference_id
     appointment_dict["appointment_date"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
-    # Save appointment
-    appointments.append(appointment_dict)
+    # Save appointment; the database generates the reference ID
+    reference_id = await run_in_threadpool(insert_appointment, appointment_dict)
+    appointment_dict["reference_id"] = reference_id
+    _cache_appointment_bytes(reference_id, orjson.dumps(appointment_dict))
     
-    # Generate PDF
-    pdf_path = generate_appointment_pdf(appointment_dict)
+    # Generate PDF off the event loop (reportlab is blocking CPU + file I/O)
+    pdf_path = await run_in_threadpool(generate_appointment_pdf, appointment_dict)
     
-    return AppointmentResponse(
-        reference_id=reference_id,
-        status="confirmed",
-        message="Appointment scheduled successfully",
-        pdf_path=pdf_path
-    )
+    return ORJSONResponse({
+        "reference_id": reference_id,
+        "status": "confirmed",
+        "message": "Appointment scheduled successfully",
+        "pdf_path": pdf_path
+    })
 
 @app.get("/appointments/{reference_id}")
 async def get_appointment(reference_id: str):
-    for apt in appointments:
-        if apt["reference_id"] == reference_id:
-            return apt
-    raise HTTPException(status_code=404, detail="Appointment not found")
+    body = _appointment_bytes.get(reference_id)
+    if body is not None:
+        _appointment_bytes.move_to_end(reference_id)
+    else:
+        # Evicted, booked on another worker, or booked before a restart
+        apt = await run_in_threadpool(fetch_appointment, reference_id)
+        if apt is None:
+            raise HTTPException(status_code=404, detail="Appointment not found")
+        body = orjson.dumps(apt)
+        _cache_appointment_bytes(reference_id, body)
+    return Response(content=body, media_type="application/json")
 
 @app.get("/appointments/")
 async def list_appointments():
-    return appointments
+    return ORJSONResponse(await run_in_threadpool(fetch_all_appointments))
+
+@app.get("/health")
+async def health():
+    return ORJSONResponse({"status": "ok"})
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Single-process server for development; use run_api.sh in production
+    uvicorn.run(
+        "api:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        log_level="warning"
+    )
@@ -3,19 +3,36 @@ import sys
 from langchain_core.messages import HumanMessage, ToolMessage, SystemMessage
 from langchain_ollama import ChatOllama
 from langchain_core.tools import tool
-import requests
+import httpx
+import orjson
 import json
 from datetime import datetime
-import base64
 import os
 import re
 
 # API configuration
 API_URL = "http://localhost:8000"
 
-# Regex patterns for validation
-PHONE_PATTERN = re.compile(r'^\+91\s\d{10}$')
-REFERENCE_ID_PATTERN = re.compile(r'^APT-\d{4}$')
+# Shared client so tool calls reuse keep-alive connections to the API.
+# Streamlit re-executes this script on every rerun, so the client is held
+# by cache_resource rather than a module global.
+@st.cache_resource
+def _get_http() -> httpx.Client:
+    """Return the process-wide HTTP client for the API"""
+    return httpx.Client(
+        base_url=API_URL,
+        timeout=10.0,
+        limits=httpx.Limits(max_keepalive_connections=20)
+    )
+
+# Regex patterns for validation, used through fullmatch so that a trailing
+# newline can't slip past a `$` anchor
+NAME_PATTERN = re.compile(r'(?:[^\W\d_]|\s)+')  # Unicode letters and whitespace
+PHONE_PATTERN = re.compile(r'\+91\s\d{10}')
+REFERENCE_ID_PATTERN = re.compile(r'APT-\d{4}')
+_check_name = NAME_PATTERN.fullmatch
+_check_phone = PHONE_PATTERN.fullmatch
+_check_ref = REFERENCE_ID_PATTERN.fullmatch
 
 # System prompt to reduce hallucinations
 SYSTEM_PROMPT = """You are a healthcare appointment assistant. Follow these strict guidelines:
@@ -54,23 +71,58 @@ Remember: It's better to ask for clarification than to make assumptions."""
 
 def validate_patient_name(name: str) -> bool:
     """Validate patient name contains only letters and spaces"""
-    return bool(name) and all(c.isalpha() or c.isspace() for c in name)
+    return _check_name(name) is not None
 
 def validate_phone_number(phone: str) -> bool:
     """Validate phone number matches Indian format"""
-    return bool(PHONE_PATTERN.match(phone))
+    return _check_phone(phone) is not None
 
 def validate_reference_id(ref_id: str) -> bool:
     """Validate appointment reference ID format"""
-    return bool(REFERENCE_ID_PATTERN.match(ref_id))
+    return _check_ref(ref_id) is not None
 
-def get_pdf_download_link(pdf_path: str, filename: str):
-    """Generate a download link for the PDF"""
+@st.cache_data(max_entries=128, show_spinner=False)
+def _read_pdf(pdf_path: str, mtime: float) -> bytes:
+    """Read PDF bytes (mtime is part of the cache key so rewrites are picked up)"""
     with open(pdf_path, "rb") as f:
-        bytes_data = f.read()
-    b64 = base64.b64encode(bytes_data).decode()
-    href = f'<a href="data:application/pdf;base64,{b64}" download="{filename}">Download Appointment PDF</a>'
-    return href
+        return f.read()
+
+# Files that already have a download button in this script run. Streamlit
+# re-executes app.py on every rerun, so this starts empty each run.
+_pdf_buttons_drawn = set()
+
+def show_pdf_download_button(pdf_path: str, filename: str):
+    """Render a download button for the PDF, once per file per run"""
+    # Identical buttons in one run would share an element ID and raise
+    # StreamlitDuplicateElementId, e.g. when the LLM checks the same
+    # reference ID twice in one response
+    if filename in _pdf_buttons_drawn:
+        return
+    _pdf_buttons_drawn.add(filename)
+    st.download_button(
+        "Download Appointment PDF",
+        data=_read_pdf(pdf_path, os.path.getmtime(pdf_path)),
+        file_name=filename,
+        mime="application/pdf",
+        # Don't rerun on click, which would clear the booking details
+        on_click="ignore"
+    )
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _fetch_appointment(reference_id: str) -> dict:
+    """Fetch an appointment record (records are immutable once booked)"""
+    response = _get_http().get(f"/appointments/{reference_id}")
+    # Raise on misses so that errors are not cached
+    response.raise_for_status()
+    return orjson.loads(response.content)
+
+@st.cache_data(ttl=5, show_spinner=False)
+def _api_health():
+    """Probe the API, returning the status code or None if unreachable"""
+    try:
+        return _get_http().get("/health").status_code
+    except Exception:
+        return None
 
 @tool(parse_docstring=True)
 def book_appointment(patient_name: str, contact_number: str):
@@ -97,16 +149,17 @@ def book_appointment(patient_name: str, contact_number: str):
 
     try:
         # Make API call to the FastAPI backend
-        response = requests.post(
-            f"{API_URL}/appointments/",
+        response = _get_http().post(
+            "/appointments/",
             json={
                 "patient_name": patient_name,
                 "contact_number": contact_number
             }
         )
         
+        # Parse the body once for both the success and error paths
+        data = orjson.loads(response.content) if response.content else {}
         if response.status_code == 200:
-            data = response.json()
             st.success("✅ Appointment booked successfully!")
             st.info(f"""
             📋 Booking Details:
@@ -117,14 +170,11 @@ def book_appointment(patient_name: str, contact_number: str):
             
             if 'pdf_path' in data and os.path.exists(data['pdf_path']):
                 pdf_filename = f"appointment_{data['reference_id']}.pdf"
-                st.markdown(
-                    get_pdf_download_link(data['pdf_path'], pdf_filename),
-                    unsafe_allow_html=True
-                )
+                show_pdf_download_button(data['pdf_path'], pdf_filename)
             
             return data
         else:
-            error_msg = response.json().get('detail', 'Unknown error occurred')
+            error_msg = data.get('detail', 'Unknown error occurred')
             st.error(f"Failed to book appointment: {error_msg}")
             return {"status": "error", "message": error_msg}
             
@@ -149,37 +199,32 @@ def check_appointment(reference_id: str):
         }
 
     try:
-        response = requests.get(f"{API_URL}/appointments/{reference_id}")
-        if response.status_code == 200:
-            data = response.json()
-            st.info(f"""
-            📋 Appointment Details:
-            - Reference: {data['reference_id']}
-            - Patient: {data['patient_name']}
-            - Contact: {data['contact_number']}
-            - Date: {data['appointment_date']}
-            - Status: {data['status']}
-            """)
-            
-            pdf_path = f"appointment_pdfs/appointment_{data['reference_id']}.pdf"
-            if os.path.exists(pdf_path):
-                pdf_filename = f"appointment_{data['reference_id']}.pdf"
-                st.markdown(
-                    get_pdf_download_link(pdf_path, pdf_filename),
-                    unsafe_allow_html=True
-                )
-            
-            return data
-        else:
-            error_msg = "Appointment not found or invalid reference ID"
-            st.error(error_msg)
-            return {"status": "error", "message": error_msg}
-            
+        data = _fetch_appointment(reference_id)
+    except httpx.HTTPStatusError:
+        error_msg = "Appointment not found or invalid reference ID"
+        st.error(error_msg)
+        return {"status": "error", "message": error_msg}
     except Exception as e:
         error_msg = f"Error checking appointment: {str(e)}"
         st.error(error_msg)
         return {"status": "error", "message": error_msg}
 
+    st.info(f"""
+    📋 Appointment Details:
+    - Reference: {data['reference_id']}
+    - Patient: {data['patient_name']}
+    - Contact: {data['contact_number']}
+    - Date: {data['appointment_date']}
+    - Status: {data['status']}
+    """)
+    
+    pdf_path = f"appointment_pdfs/appointment_{data['reference_id']}.pdf"
+    if os.path.exists(pdf_path):
+        pdf_filename = f"appointment_{data['reference_id']}.pdf"
+        show_pdf_download_button(pdf_path, pdf_filename)
+    
+    return data
+
 def main():
     st.title("🏥 Healthcare Appointment System")
     
@@ -189,27 +234,40 @@ def main():
             SystemMessage(content=SYSTEM_PROMPT)
         ]
 
+    # Initialize LLM with tools once per session
+    if 'llm' not in st.session_state:
+        llm = ChatOllama(
+            model="mistral-nemo:latest",
+            temperature=0.1,  # Lower temperature for more focused responses
+            # Keep the model loaded between turns so Ollama can reuse the KV
+            # cache for the unchanged message-history prefix
+            keep_alive="30m"
+        )
+        st.session_state.llm = llm.bind_tools([book_appointment, check_appointment])
+
     # Add a sidebar to check API connection
     with st.sidebar:
         st.header("System Status")
-        try:
-            response = requests.get(f"{API_URL}/appointments/")
-            if response.status_code == 200:
-                st.success("✅ Connected to API")
-            else:
-                st.error("❌ API Error")
-        except:
+        status_code = _api_health()
+        if status_code == 200:
+            st.success("✅ Connected to API")
+        elif status_code is not None:
+            st.error("❌ API Error")
+        else:
             st.error("❌ Cannot connect to API")
             st.warning("Please ensure the API server is running on " + API_URL)
 
-    # Chat interface
+    # Chat interface, rendered as a single markdown block so that a long
+    # history costs one Streamlit element per rerun instead of one per message
+    history = []
     for message in st.session_state.messages[1:]:  # Skip system prompt in display
-        if isinstance(message, HumanMessage):
-            with st.chat_message("user"):
-                st.write(message.content)
-        else:
-            with st.chat_message("assistant"):
-                st.write(message.content)
+        if not message.content:
+            continue
+        prefix = "**You:** " if isinstance(message, HumanMessage) else "**Assistant:** "
+        history.append(prefix + message.content)
+    if history:
+        with st.container():
+            st.markdown("\n\n".join(history))
 
     # User input
     user_input = st.chat_input("How can I help you today?")
@@ -218,12 +276,7 @@ def main():
         with st.chat_message("user"):
             st.write(user_input)
 
-        # Initialize LLM with tools
-        llm = ChatOllama(
-            model="mistral-nemo:latest",
-            temperature=0.1  # Lower temperature for more focused responses
-        )
-        llm_with_tools = llm.bind_tools([book_appointment, check_appointment])
+        llm_with_tools = st.session_state.llm
         
         st.session_state.messages.append(HumanMessage(content=user_input))
         
@@ -242,8 +295,10 @@ def main():
                         else:
                             tool_response = check_appointment.invoke(tool_call["args"])
                         
+                        # Sorted-key JSON so identical results serialise to
+                        # identical tokens for Ollama's prompt cache
                         st.session_state.messages.append(
-                            ToolMessage(content=str(tool_response), 
+                            ToolMessage(content=orjson.dumps(tool_response, option=orjson.OPT_SORT_KEYS).decode(), 
                                       tool_call_id=tool_call["id"])
                         )
                 
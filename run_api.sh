@@ -0,0 +1,8 @@
+#!/bin/sh
+# Production launcher: gunicorn managing 2*cpu+1 uvicorn worker processes.
+# Appointments are stored in SQLite, so every worker shares the same data.
+exec gunicorn api:app \
+    -k uvicorn.workers.UvicornWorker \
+    -w "${API_WORKERS:-$((2 * $(nproc) + 1))}" \
+    --bind 0.0.0.0:8000 \
+    --worker-tmp-dir /dev/shm